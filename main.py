@@ -3,19 +3,83 @@ import pandas as pd
 from datetime import datetime
 import sqlite3
 from sqlalchemy import create_engine
+from sqlalchemy import inspect
 from sqlalchemy import text
+from sqlalchemy.exc import NoSuchTableError
 from sqlalchemy.orm import sessionmaker
 import io
+import logging
 import mysql.connector
 import openpyxl
 import pytz
-from time import sleep
+import random
+import sys
+import threading
+from time import sleep, monotonic
+
+# Copy-on-Write: seleções de colunas, .drop(), .rename() etc. não copiam os dados até
+# alguém tentar alterá-los, e uma alteração nunca "vaza" para o DataFrame de origem.
+# Filtrar LINHAS (df.loc[mascara]) continua gerando um DataFrame novo.
+# (a partir do pandas 3.0 já é o padrão e a opção não existe mais)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+# Log do app (o Streamlit só configura o logger dele)
+logger = logging.getLogger("corte_lancamento")
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
 
 # Configuração da página para ocupar mais espaço na tela
 st.set_page_config(page_title="Datas de Corte e Lançamento", layout="wide")
 
-
+# --- RESILIÊNCIA DA LEITURA ---
+# Tempo máximo para conseguir uma conexão (abrir no banco ou esperar vaga no pool)
+TIMEOUT_CONEXAO = 5  # segundos
+# Tempo máximo de execução de cada SELECT (uma página da leitura) no servidor
+# (hint MAX_EXECUTION_TIME do MySQL/TiDB)
+TIMEOUT_CONSULTA_MS = 10000
+# Tempo máximo esperando o socket (cada leitura/escrita de pacote, em qualquer comando).
+# Fica acima do TIMEOUT_CONSULTA_MS para o servidor cancelar o SELECT antes.
+TIMEOUT_SOCKET = 15  # segundos
+# Validade do snapshot compartilhado
+TTL_SNAPSHOT = 120  # segundos
+# Tentativas de leitura com espera exponencial + jitter entre elas (só quando ainda
+# não há snapshot nenhum para mostrar; com snapshot antigo é uma tentativa só)
+LEITURA_TENTATIVAS = 3
+LEITURA_BACKOFF_BASE = 0.5  # segundos
+# Depois de uma atualização que falhou, serve o snapshot antigo sem tentar de novo por um tempo
+LEITURA_ESPERA_APOS_FALHA = 10  # segundos
+# Disjuntor: depois de N leituras falhas seguidas, para de ir ao banco por um tempo
+DISJUNTOR_LIMITE_FALHAS = 3
+DISJUNTOR_ESPERA = 30  # segundos
+
+# --- LEITURA EM LOTES ---
+# Linhas por página lida do banco (paginação por id)
+TAMANHO_LOTE_LEITURA = 5000
+# Só as colunas que o app usa, na ordem da tela (nada de SELECT *)
+COLUNAS_TABELA = [
+    'id', 'Convênio', 'Sistema', 'Responsavel', 'Validação', 'Referência',
+    'Data de Corte', 'Data de Lançamento', 'Alterado em', 'versao'
+]
+# Texto vira string do Arrow (bem menor que object); datas são tratadas à parte
+TIPOS_COLUNAS = {
+    'Convênio': 'string[pyarrow]',
+    'Sistema': 'string[pyarrow]',
+    'Responsavel': 'string[pyarrow]',
+    'Validação': 'string[pyarrow]',
+    'Referência': 'string[pyarrow]',
+    'versao': 'int64',
+}
+
+
+@st.cache_resource
 def init_db_engine():
+    # Permite apontar para outro banco compatível (ex.: SQLite local do teste_carga.py)
+    url = st.secrets["mysql"].get("url")
+    if url:
+        return create_engine(url, pool_pre_ping=True)
+
     # Pega os dados
     user = st.secrets["mysql"]["user"]
     password = st.secrets["mysql"]["password"]
@@ -31,37 +95,79 @@ def init_db_engine():
         pool_size=5,
         max_overflow=10,
         pool_pre_ping=True,  # Evita erro de conexão perdida
-        pool_recycle=3600
+        pool_recycle=3600,
+        pool_timeout=TIMEOUT_CONEXAO,
+        # connection_timeout vale só para abrir a conexão; read/write_timeout valem
+        # para cada comando depois disso (mysql-connector-python >= 9.3)
+        connect_args={
+            "connection_timeout": TIMEOUT_CONEXAO,
+            "read_timeout": TIMEOUT_SOCKET,
+            "write_timeout": TIMEOUT_SOCKET,
+        }
     )
 
 
+@st.cache_resource(ttl=300)
+def tem_coluna_versao():
+    """
+    Diz se a tabela já tem a coluna `versao` (criada pela migração
+    migracoes/001_coluna_versao.sql). Sem ela o app funciona igual, só que
+    sem a checagem de conflito entre edições simultâneas.
+    """
+    try:
+        colunas = inspect(init_db_engine()).get_columns('tabela_corte')
+    except NoSuchTableError:
+        return False
+    return any(c['name'] == 'versao' for c in colunas)
+
+
 # Atualize a função de leitura para usar a Engine
-@st.cache_data(ttl=120)
 def carregar_dados_do_banco():
-    """Lê os dados usando a Engine (Thread-safe)"""
+    """Lê os dados usando a Engine (Thread-safe). Erros de conexão/consulta sobem como exceção"""
 
     # Pega a engine do cache (seguro compartilhar)
     engine = init_db_engine()
 
     try:
-        # Pandas adora Engine! Ele gerencia a conexão sozinho (abre, lê, fecha)
-        # Isso resolve o Warning e o Segmentation Fault
-        df = pd.read_sql('SELECT * FROM tabela_corte', engine)
-
-        # Seus tratamentos continuam iguais...
-        cols_datas = ['Data de Corte', 'Data de Lançamento']
-
-        # Padronização de nomes (caso precise)
-        mapa_colunas = {
-            'Data_Corte': 'Data de corte',
-            'Data_Lancamento': 'Data de lançamento',
-            'Data de Lancamento': 'Data de lançamento'
-        }
-        df = df.rename(columns=mapa_colunas)
-
-        for col in cols_datas:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True)
+        colunas = [c for c in COLUNAS_TABELA if c != 'versao' or tem_coluna_versao()]
+        colunas_sql = ", ".join(f"`{c}`" for c in colunas)
+        query = text(
+            f'SELECT /*+ MAX_EXECUTION_TIME({TIMEOUT_CONSULTA_MS}) */ {colunas_sql} FROM tabela_corte '
+            'WHERE id > :ultimo ORDER BY id LIMIT :n'
+        )
+
+        # Lemos página por página (paginação por id), cada uma um SELECT curto que
+        # traz no máximo TAMANHO_LOTE_LEITURA linhas. O mysql-connector não tem cursor
+        # do lado do servidor, então um SELECT só traria a tabela inteira para a memória
+        # do driver. Cada página já é convertida para os tipos finais antes da próxima,
+        # então o pico fica perto do tamanho final. Todas as páginas rodam na mesma
+        # transação, logo enxergam o mesmo snapshot do banco (REPEATABLE READ/TiDB).
+        lotes = []
+        bytes_lotes = 0
+        pico_bytes = 0
+        ultimo_id = 0
+        with engine.connect() as conn:
+            while True:
+                lote = pd.read_sql(query, conn, params={"ultimo": ultimo_id, "n": TAMANHO_LOTE_LEITURA})
+                if lote.empty:
+                    break
+                ultimo_id = int(lote['id'].iloc[-1])
+                bytes_brutos = tamanho_em_bytes(lote)
+                lote = tratar_lote(lote)
+                bytes_lotes += tamanho_em_bytes(lote)
+                # lote bruto + tudo que já foi convertido
+                pico_bytes = max(pico_bytes, bytes_lotes + bytes_brutos)
+                lotes.append(lote)
+                if len(lote) < TAMANHO_LOTE_LEITURA:
+                    break
+
+        if not lotes:
+            return pd.DataFrame(columns=colunas)
+
+        # Junta os lotes já tipados numa alocação só e solta os pedaços
+        df = pd.concat(lotes, ignore_index=True)
+        pico_bytes = max(pico_bytes, bytes_lotes + tamanho_em_bytes(df))
+        del lotes
 
         # mês atual e próximo mês
         # mapa de meses
@@ -83,8 +189,7 @@ def carregar_dados_do_banco():
         excecoes = ['PINDARÉ-MIRIM', 'ITAPECURU-MIRIM']
         excecoes_compt_anterior = ['PREF. BARBACENA']
 
-        # cria colunas auxiliares
-        df['Data de Corte'] = pd.to_datetime(df['Data de Corte'], errors='coerce', dayfirst=True)
+        # cria colunas auxiliares (as datas já vêm convertidas do tratar_lote)
         df['mes_base'] = df['Data de Corte'].dt.month
         df['dia'] = df['Data de Corte'].dt.day
 
@@ -109,20 +214,269 @@ def carregar_dados_do_banco():
         df.loc[df['mes_referencia'] == 13, 'mes_referencia'] = 1
 
         # converter para nome do mês
-        df['Referência'] = df['mes_referencia'].map(mapa_meses)
+        df['Referência'] = df['mes_referencia'].map(mapa_meses).astype(TIPOS_COLUNAS['Referência'])
 
         # opcional: remover colunas auxiliares
         df.drop(columns=['mes_base', 'dia', 'mes_referencia'], inplace=True)
 
+        registrar_carga(len(df), pico_bytes, tamanho_em_bytes(df))
         return df
 
     except Exception as e:
         # Se tabela não existe
         if "1146" in str(e):
             return pd.DataFrame()
+        # Qualquer outro erro (banco fora, timeout...) sobe para a retentativa/disjuntor
+        raise
+
+
+def tratar_lote(lote):
+    """Converte os tipos de um lote recém-lido do banco (única conversão das datas)"""
+    for col in ['Data de Corte', 'Data de Lançamento']:
+        lote[col] = pd.to_datetime(lote[col], errors='coerce', dayfirst=True)
+    lote['Alterado em'] = pd.to_datetime(lote['Alterado em'], errors='coerce')
+
+    return lote.astype({c: t for c, t in TIPOS_COLUNAS.items() if c in lote.columns})
+
+
+def registrar_carga(linhas, pico_bytes, final_bytes):
+    """
+    Guarda (e manda pro log) o consumo de memória da última leitura do banco.
+    Os números contam só os DataFrames (lotes + resultado), não o buffer do driver
+    nem o resto do processo.
+    """
+    carga = {
+        'linhas': linhas,
+        'pico_mb': pico_bytes / 1024 ** 2,
+        'final_mb': final_bytes / 1024 ** 2,
+    }
+    logger.info(
+        "Carga da tabela_corte: %d linhas, DataFrames: pico ~%.2f MB, final %.2f MB",
+        linhas, carga['pico_mb'], carga['final_mb']
+    )
+    estado = estado_leitura()
+    with estado['lock']:
+        estado['ultima_carga'] = carga
+
+
+@st.cache_resource
+def estado_leitura():
+    """
+    Estado compartilhado entre as sessões: snapshot atual + disjuntor.
+    Tudo é lido/escrito com o 'lock'; 'lock_carga' garante uma leitura do banco por vez.
+    """
+    return {
+        'lock': threading.Lock(),
+        'lock_carga': threading.Lock(),
+        'snapshot': None,  # último snapshot bom (somente leitura, compartilhado)
+        'snapshot_em': None,  # datetime da leitura que gerou o snapshot
+        'carregado_em': 0.0,  # monotonic() da mesma leitura, para o TTL
+        # Cada escrita soma 1 em 'geracao'; o snapshot guarda a geração de quando a
+        # leitura COMEÇOU. Se forem diferentes, o snapshot pode não ter a escrita.
+        'geracao': 0,
+        'geracao_snapshot': 0,
+        'falhou_em': None,  # monotonic() da última atualização que falhou
+        'falhas_seguidas': 0,
+        'aberto_ate': 0.0,  # monotonic() até quando o disjuntor fica aberto
+        'ultimo_erro': None,
+        'ultima_carga': None,  # memória da última leitura (registrar_carga)
+    }
+
+
+def carregar_com_retentativa(tentativas=LEITURA_TENTATIVAS):
+    """
+    carregar_dados_do_banco com retentativa (backoff exponencial com jitter) e disjuntor.
+
+    Com o disjuntor aberto a função falha na hora, sem ir ao banco, para que um banco
+    lento não segure o rerun de todo mundo.
+    """
+    estado = estado_leitura()
+
+    with estado['lock']:
+        espera = estado['aberto_ate'] - monotonic()
+        ultimo_erro = estado['ultimo_erro']
+    if espera > 0:
+        raise ConnectionError(
+            f"Banco indisponível ({ultimo_erro}). Nova tentativa em {espera:.0f}s."
+        )
+
+    for tentativa in range(tentativas):
+        try:
+            df = carregar_dados_do_banco()
+        except Exception as e:
+            erro = e
+            if tentativa < tentativas - 1:
+                # "Full jitter": espera aleatória entre 0 e base * 2^tentativa
+                sleep(random.uniform(0, LEITURA_BACKOFF_BASE * 2 ** tentativa))
         else:
-            st.error(f"Erro ao carregar dados: {e}")
-            return pd.DataFrame()
+            with estado['lock']:
+                estado['falhas_seguidas'] = 0
+                estado['aberto_ate'] = 0.0
+            return df
+
+    with estado['lock']:
+        estado['falhas_seguidas'] += 1
+        estado['ultimo_erro'] = erro
+        if estado['falhas_seguidas'] >= DISJUNTOR_LIMITE_FALHAS:
+            estado['aberto_ate'] = monotonic() + DISJUNTOR_ESPERA
+    raise erro
+
+def preparar_visualizacao(df_visualizacao):
+    """Ordena pela alteração mais recente (as datas já vêm convertidas do tratar_lote)"""
+    # Ordena da modificação mais recente para a mais antiga.
+    # na_position='last' garante que linhas sem data de alteração fiquem no fim da tabela.
+    # O índice vira a posição (0..n-1), que é o que as sessões usam como seleção.
+    return df_visualizacao.sort_values(
+        by='Alterado em', ascending=False, na_position='last', ignore_index=True
+    )
+
+
+def carregar_snapshot(tentativas):
+    """Lê o banco, prepara o DataFrame e publica como snapshot compartilhado"""
+    estado = estado_leitura()
+    with estado['lock']:
+        geracao = estado['geracao']
+    try:
+        df = carregar_com_retentativa(tentativas)
+    except Exception:
+        with estado['lock']:
+            estado['falhou_em'] = monotonic()
+        raise
+
+    if not df.empty:
+        df = preparar_visualizacao(df)
+    with estado['lock']:
+        estado['snapshot'] = df
+        estado['snapshot_em'] = datetime.now(pytz.timezone('America/Sao_Paulo'))
+        estado['carregado_em'] = monotonic()
+        # Uma escrita durante a leitura mantém o snapshot invalidado (geracao mudou)
+        estado['geracao_snapshot'] = geracao
+        estado['falhou_em'] = None
+    return df
+
+
+def snapshot_em_dia(estado):
+    """Snapshot dentro do TTL e sem escrita depois do início da leitura. Chamar com o 'lock'"""
+    return (
+        estado['snapshot'] is not None
+        and estado['geracao_snapshot'] == estado['geracao']
+        and monotonic() - estado['carregado_em'] < TTL_SNAPSHOT
+    )
+
+
+def falhou_depois_de(estado, instante):
+    """Uma leitura terminou em erro depois de `instante` (monotonic). Chamar com o 'lock'"""
+    return estado['falhou_em'] is not None and estado['falhou_em'] >= instante
+
+
+def obter_base():
+    """
+    Devolve (snapshot, desatualizado_desde).
+
+    O snapshot é COMPARTILHADO entre todas as sessões (somente leitura): NUNCA altere
+    o DataFrame retornado, gere um novo a partir dele (filtro, seleção de colunas...).
+
+    Quando o snapshot vence (TTL_SNAPSHOT), uma sessão só tenta atualizar, com UMA
+    tentativa; as outras recebem o snapshot atual na hora, sem esperar. Se a
+    atualização falhar, o snapshot antigo continua sendo servido (stale-while-error)
+    e `desatualizado_desde` traz a hora dele; com dados em dia vem None.
+    Só quando ainda não existe snapshot nenhum a sessão espera a leitura completa,
+    com todas as tentativas. Quem espera na fila reaproveita o resultado (dado ou
+    erro) da leitura que acabou de terminar, em vez de repetir a leitura inteira.
+    """
+    estado = estado_leitura()
+    with estado['lock']:
+        snapshot = estado['snapshot']
+        snapshot_em = estado['snapshot_em']
+        em_dia = snapshot_em_dia(estado)
+        invalidado = estado['geracao_snapshot'] != estado['geracao']
+        falhou_em = estado['falhou_em']
+
+    desatualizado_desde = snapshot_em if falhou_em is not None else None
+
+    if em_dia:
+        return snapshot, None
+
+    # 1. Ainda não tem nada para mostrar: espera (uma sessão lê, as outras aguardam o resultado)
+    if snapshot is None:
+        inicio_espera = monotonic()
+        with estado['lock_carga']:
+            with estado['lock']:
+                snapshot = estado['snapshot']
+                erro = estado['ultimo_erro'] if falhou_depois_de(estado, inicio_espera) else None
+            if snapshot is not None:
+                return snapshot, None
+            if erro is not None:
+                # A leitura de quem estava na frente acabou de falhar: não repete o ciclo
+                st.error(f"Erro ao carregar dados: {erro}")
+                return pd.DataFrame(), None
+            try:
+                return carregar_snapshot(LEITURA_TENTATIVAS), None
+            except Exception as e:
+                st.error(f"Erro ao carregar dados: {e}")
+                return pd.DataFrame(), None
+
+    # 2. Tem snapshot, mas vencido. Logo depois de uma falha nem tenta de novo.
+    if falhou_em is not None and monotonic() - falhou_em < LEITURA_ESPERA_APOS_FALHA:
+        return snapshot, desatualizado_desde
+
+    # Depois de uma gravação (invalidado) vale esperar a recarga, para quem salvou ver
+    # o próprio dado; no TTL normal, se outra sessão já está lendo, segue com o atual.
+    inicio_espera = monotonic()
+    if not estado['lock_carga'].acquire(blocking=invalidado):
+        return snapshot, desatualizado_desde
+    try:
+        with estado['lock']:
+            if snapshot_em_dia(estado):
+                # outra sessão atualizou (já com a escrita) enquanto esperávamos
+                return estado['snapshot'], None
+            if falhou_depois_de(estado, inicio_espera):
+                return estado['snapshot'], estado['snapshot_em']
+        return carregar_snapshot(1), None
+    except Exception:
+        return snapshot, snapshot_em
+    finally:
+        estado['lock_carga'].release()
+
+
+def limpar_cache():
+    """Invalida o snapshot compartilhado depois de uma escrita"""
+    estado = estado_leitura()
+    with estado['lock']:
+        estado['geracao'] += 1
+
+
+def tamanho_em_bytes(obj, vistos=None):
+    """Tamanho aproximado de `obj`, entrando em listas/dicts (cada objeto conta uma vez)"""
+    if vistos is None:
+        vistos = set()
+    if id(obj) in vistos:
+        return 0
+    vistos.add(id(obj))
+
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(
+            tamanho_em_bytes(k, vistos) + tamanho_em_bytes(v, vistos) for k, v in obj.items()
+        )
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(tamanho_em_bytes(o, vistos) for o in obj)
+    return sys.getsizeof(obj)
+
+
+def medir_memoria_sessao(*objetos, ignorar=None):
+    """
+    Soma os bytes dos objetos desta sessão: o st.session_state e os objetos criados
+    neste rerun. O snapshot atual (`ignorar`) não entra na conta.
+
+    Não é o custo total da sessão no servidor: os argumentos guardados pelos
+    fragmentos podem manter vivo um snapshot antigo depois que o cache renova.
+    """
+    vistos = set() if ignorar is None else {id(ignorar)}
+    objetos = list(st.session_state.to_dict().values()) + list(objetos)
+    return sum(tamanho_em_bytes(o, vistos) for o in objetos)
+
 
 def get_hora_brasilia():
     fuso = pytz.timezone('America/Sao_Paulo')
@@ -159,7 +513,10 @@ def salvar_no_banco(df, nome_tabela='tabela_corte'):
                 `Data de Corte` = VALUES(`Data de Corte`),
                 `Data de Lançamento` = VALUES(`Data de Lançamento`),
                 `Alterado em` = VALUES(`Alterado em`) -- Atualiza sempre
-        """)
+        """ + (
+            # Invalida edições abertas em cima da versão antiga
+            ", versao = versao + 1" if tem_coluna_versao() else ""
+        ))
 
         def limpar_data(valor):
             if pd.isna(valor) or str(valor) == 'NaT':
@@ -181,7 +538,7 @@ def salvar_no_banco(df, nome_tabela='tabela_corte'):
 
         session.commit()
         st.success(f"✅ Sincronização concluída! {len(df_limpo)} convênios processados.")
-        st.cache_data.clear()
+        limpar_cache()
         return True
 
     except Exception as e:
@@ -192,80 +549,149 @@ def salvar_no_banco(df, nome_tabela='tabela_corte'):
         session.close()
 
 
+# Quantas operações (DELETE/UPDATE/INSERT) vão em cada transação curta
+TAMANHO_LOTE_EDICAO = 50
+
+
+def formatar_data_sql(valor):
+    # --- TRATAMENTO SEGURO DE DATAS ---
+    # Forçamos a data a virar uma string no formato ISO (AAAA-MM-DD)
+    # Isso impede o MySQL de inverter dia com mês
+    if pd.isna(valor): return None
+    try:
+        return pd.to_datetime(valor).strftime('%Y-%m-%d')
+    except:
+        return None
+
+
 def salvar_edicoes_cirurgicas(df_editado, df_original, df_filtrado_antes_da_edicao):
+    """
+    Salva as edições da tabela com controle de concorrência otimista.
+
+    Cada UPDATE/DELETE só é aplicado se a `versao` da linha no banco ainda for a mesma
+    que o usuário viu na tela (compare-and-swap). As operações são enviadas em lotes de
+    TAMANHO_LOTE_EDICAO, cada lote na sua própria transação curta. As linhas que outra
+    pessoa alterou nesse meio tempo não são sobrescritas e voltam como conflito.
+
+    Se a base ainda não tem a coluna `versao` (migração não aplicada), salva sem
+    checagem de conflito, como antes.
+    """
     engine = init_db_engine()
     agora = get_hora_brasilia()
+    usar_versao = 'versao' in df_original.columns
+
+    if usar_versao:
+        query_delete = text("DELETE FROM tabela_corte WHERE id=:id AND versao=:versao")
+        query_update = text("""
+            UPDATE tabela_corte SET
+            Convênio=:conv, Sistema=:sis, Responsavel=:resp,
+            Validação=:val, Referência=:ref, `Data de Corte`=:dt_c,
+            `Data de Lançamento`=:dt_l, `Alterado em`=:alt, versao=versao+1
+            WHERE id=:id AND versao=:versao
+        """)
+    else:
+        query_delete = text("DELETE FROM tabela_corte WHERE id=:id")
+        query_update = text("""
+            UPDATE tabela_corte SET
+            Convênio=:conv, Sistema=:sis, Responsavel=:resp,
+            Validação=:val, Referência=:ref, `Data de Corte`=:dt_c,
+            `Data de Lançamento`=:dt_l, `Alterado em`=:alt
+            WHERE id=:id
+        """)
+    # O INSERT não manda `versao`: o banco usa o DEFAULT 0 (ou a coluna nem existe)
+    query_insert = text("""
+        INSERT INTO tabela_corte (
+            Convênio, Sistema, Responsavel, Validação, Referência,
+            `Data de Corte`, `Data de Lançamento`, `Alterado em`
+        ) VALUES (
+            :conv, :sis, :resp, :val, :ref, :dt_c, :dt_l, :alt
+        )
+    """)
+
+    # Lista de (query, params, rótulo da linha). Rótulo = None quando não há checagem
+    # de conflito (INSERT, ou base sem a coluna `versao`)
+    operacoes = []
+
+    # 1. DELEÇÃO
+    ids_que_estavam_na_tela = set(df_filtrado_antes_da_edicao['id'].dropna().astype(int).tolist())
+    ids_que_ficaram_apos_edicao = set(df_editado['id'].dropna().astype(int).tolist())
+    ids_para_deletar = ids_que_estavam_na_tela - ids_que_ficaram_apos_edicao
+
+    for _, row in df_filtrado_antes_da_edicao[df_filtrado_antes_da_edicao['id'].isin(ids_para_deletar)].iterrows():
+        operacoes.append((
+            query_delete,
+            {"id": int(row['id']), "versao": int(row['versao'])} if usar_versao else {"id": int(row['id'])},
+            f"{row['Convênio']} (excluído)" if usar_versao else None
+        ))
+
+    # 2. UPDATE E INSERT
+    for i, row in df_editado.iterrows():
+        dt_corte = formatar_data_sql(row.get('Data de Corte'))
+        dt_lanca = formatar_data_sql(row.get('Data de Lançamento'))
+
+        params = {
+            "conv": None if pd.isna(row.get('Convênio')) else row.get('Convênio'),
+            "sis": None if pd.isna(row.get('Sistema')) else row.get('Sistema'),
+            "resp": None if pd.isna(row.get('Responsavel')) else row.get('Responsavel'),
+            "val": None if pd.isna(row.get('Validação')) else row.get('Validação'),
+            "ref": None if pd.isna(row.get('Referência')) else row.get('Referência'),
+            "dt_c": dt_corte,
+            "dt_l": dt_lanca,
+            "alt": agora
+        }
 
-    with engine.connect() as conn:
-        with conn.begin():
-            # 1. DELEÇÃO (Mantida)
-            ids_que_estavam_na_tela = set(df_filtrado_antes_da_edicao['id'].dropna().astype(int).tolist())
-            ids_que_ficaram_apos_edicao = set(df_editado['id'].dropna().astype(int).tolist())
-            ids_para_deletar = ids_que_estavam_na_tela - ids_que_ficaram_apos_edicao
-
-            if ids_para_deletar:
-                format_ids = ", ".join(map(str, ids_para_deletar))
-                conn.execute(text(f"DELETE FROM tabela_corte WHERE id IN ({format_ids})"))
-
-            # 2. UPDATE E INSERT
-            for i, row in df_editado.iterrows():
-                # --- TRATAMENTO SEGURO DE DATAS ---
-                # Forçamos a data a virar uma string no formato ISO (AAAA-MM-DD)
-                # Isso impede o MySQL de inverter dia com mês
-                def formatar_data_sql(valor):
-                    if pd.isna(valor): return None
-                    try:
-                        return pd.to_datetime(valor).strftime('%Y-%m-%d')
-                    except:
-                        return None
-
-                dt_corte = formatar_data_sql(row.get('Data de Corte'))
-                dt_lanca = formatar_data_sql(row.get('Data de Lançamento'))
-
-                params = {
-                    "conv": None if pd.isna(row.get('Convênio')) else row.get('Convênio'),
-                    "sis": None if pd.isna(row.get('Sistema')) else row.get('Sistema'),
-                    "resp": None if pd.isna(row.get('Responsavel')) else row.get('Responsavel'),
-                    "val": None if pd.isna(row.get('Validação')) else row.get('Validação'),
-                    "ref": None if pd.isna(row.get('Referência')) else row.get('Referência'),
-                    "dt_c": dt_corte,
-                    "dt_l": dt_lanca,
-                    "alt": agora
-                }
+        # CASO A: INSERT
+        if pd.isna(row.get('id')):
+            operacoes.append((query_insert, params, None))
 
-                # CASO A: INSERT
-                if pd.isna(row.get('id')):
-                    query_insert = text("""
-                        INSERT INTO tabela_corte (
-                            Convênio, Sistema, Responsavel, Validação, Referência, 
-                            `Data de Corte`, `Data de Lançamento`, `Alterado em`
-                        ) VALUES (
-                            :conv, :sis, :resp, :val, :ref, :dt_c, :dt_l, :alt
-                        )
-                    """)
-                    conn.execute(query_insert, params)
-
-                # CASO B: UPDATE
-                else:
-                    id_atual = int(row['id'])
-                    linha_original = df_original[df_original['id'] == id_atual]
-
-                    if not linha_original.empty:
-                        # Comparamos apenas as colunas relevantes para ver se mudou
-                        if not row.equals(linha_original.iloc[0]):
-                            params["id"] = id_atual
-                            query_update = text("""
-                                UPDATE tabela_corte SET 
-                                Convênio=:conv, Sistema=:sis, Responsavel=:resp,
-                                Validação=:val, Referência=:ref, `Data de Corte`=:dt_c, 
-                                `Data de Lançamento`=:dt_l, `Alterado em`=:alt
-                                WHERE id=:id
-                            """)
-                            conn.execute(query_update, params)
-
-    st.cache_data.clear()
-    st.success("✅ Alterações salvas com sucesso!")
-    sleep(2)
+        # CASO B: UPDATE
+        else:
+            id_atual = int(row['id'])
+            linha_original = df_original[df_original['id'] == id_atual]
+
+            if not linha_original.empty:
+                # Comparamos apenas as colunas relevantes para ver se mudou
+                if not row.equals(linha_original.iloc[0]):
+                    params["id"] = id_atual
+                    if usar_versao:
+                        # A versão vem do original (o que o usuário viu), não da tela
+                        params["versao"] = int(linha_original.iloc[0]['versao'])
+                    operacoes.append((query_update, params, row.get('Convênio') if usar_versao else None))
+
+    # 3. EXECUÇÃO EM LOTES (transações curtas = locks curtos no TiDB)
+    conflitos = []
+    gravadas = 0  # operações de lotes já confirmados (commit)
+    try:
+        for inicio in range(0, len(operacoes), TAMANHO_LOTE_EDICAO):
+            lote = operacoes[inicio:inicio + TAMANHO_LOTE_EDICAO]
+            conflitos_lote = []
+            with engine.begin() as conn:
+                for query, params, rotulo in lote:
+                    resultado = conn.execute(query, params)
+                    # Nenhuma linha afetada = alguém alterou/excluiu a linha antes de nós
+                    if rotulo is not None and resultado.rowcount == 0:
+                        conflitos_lote.append(rotulo)
+            # Só conta depois do commit: um lote que falhou é desfeito inteiro
+            gravadas += len(lote)
+            conflitos.extend(conflitos_lote)
+    except Exception as e:
+        limpar_cache()
+        if conflitos:
+            st.session_state['conflitos_edicao'] = conflitos
+        st.error(
+            f"❌ Erro ao salvar alterações: {e}\n\n"
+            f"{gravadas} de {len(operacoes)} operações já tinham sido gravadas (lotes anteriores). "
+            "As linhas a partir do lote que falhou **não foram salvas**."
+        )
+        return
+
+    limpar_cache()
+    if conflitos:
+        # Guardamos para mostrar depois do rerun (a tabela já vem com os dados atuais do banco)
+        st.session_state['conflitos_edicao'] = conflitos
+    else:
+        st.success("✅ Alterações salvas com sucesso!")
+        sleep(2)
     st.rerun()
 
 def tratar_planilha(uploaded_file):
@@ -370,6 +796,15 @@ def to_excel(df):
 
 # --- INTERFACE DO STREAMLIT ---
 
+# Intervalo de atualização automática do popover de alertas (o mesmo TTL do snapshot)
+INTERVALO_ALERTAS = f"{TTL_SNAPSHOT}s"
+
+COLUNAS_RESUMO_CONFIG = {
+    "Data de Corte": st.column_config.DateColumn("Data de Corte", format="DD/MM/YYYY"),
+    "Data de Lançamento": st.column_config.DateColumn("Data de Lançamento", format="DD/MM/YYYY"),
+}
+
+
 st.title("📂 Sistema Compartilhado de Convênios")
 
 # --- FUNÇÃO PARA LIMPAR (Coloque isso antes do sidebar ou no topo do script) ---
@@ -408,7 +843,7 @@ with st.sidebar:
                         # Espera 2 segundinhos para você ver a mensagem verde antes de sumir
                         sleep(2)
                         # Limpa o cache para o gráfico novo aparecer
-                        st.cache_data.clear()
+                        limpar_cache()
                         st.rerun()
                     else:
                         st.error("❌ Ocorreu um erro ao salvar no banco. Verifique os logs.")
@@ -416,126 +851,47 @@ with st.sidebar:
                 except Exception as e:
                     st.error(f"Erro crítico no processamento: {e}")
 
-    st.divider()
-
-    # --- AQUI ENTRAM OS SEUS FILTROS ---
-    st.header("🔍 Filtros de Visualização")
-
     # Dica de Performance: Carregue os dados uma vez só numa variável
-    df_banco = carregar_dados_do_banco()
+    # (é o snapshot compartilhado, não uma cópia desta sessão)
+    df_banco, desatualizado_desde = obter_base()
 
-    # --- TRAVA DE SEGURANÇA ---
-    # Se o banco estiver vazio, interrompemos a construção dos filtros para não dar erro
     if df_banco.empty:
         st.info("ℹ️ Nenhuma base de dados carregada no momento.")
-        # O st.stop() faz o Streamlit parar de ler o código daqui pra baixo (na sidebar)
-        # Isso evita que ele tente ler colunas que não existem.
-        st.stop()
-
-        # --- SE PASSOU DA TRAVA, SEGUE O BAILE ---
-
-    convenios_filtro = st.multiselect(
-        "Filtrar Convênios:",
-        options=df_banco['Convênio'].unique(),
-        key='f_convenio'
-    )
-
-    sistema_filtro = st.multiselect(
-        "Filtra Sistemas:",
-        options=df_banco['Sistema'].unique(),
-        key='f_sistema'
-    )
-
-    responsavel_filtro = st.multiselect(
-        "Responsável:",
-        options=df_banco['Responsavel'].unique(),
-        key='f_resp'
-    )
 
-    validacao_filtro = st.multiselect(
-        "Validador:",
-        options=df_banco['Validação'].unique(),
-        key='f_validacao'
-    )
-
-    # 2. Seus filtros de Data
-    data_filtro_lancamento = st.date_input(
-        "Data de Lançamento exata:",
-        value=None,
-        format="DD/MM/YYYY",
-        key='f_data_lanc'
-    )
-
-    data_filtro_corte = st.date_input(
-        "Data de Corte exata:",
-        value=None,
-        format="DD/MM/YYYY",
-        key='f_data_corte'
-    )
-
-    # O botão chama a função ANTES de rodar o app de novo
-    st.button("Limpar Filtros", on_click=limpar_tudo)
-
-# 1. Carrega do Banco
-df_base_original = carregar_dados_do_banco()
-
-# --- ÁREA PRINCIPAL ---
-if not df_base_original.empty:
-
-    # 1. Garante que o Pandas entende a coluna como Data Real (e não texto)
-    # Se já for data, ele só ignora e mantém.
-    df_base_original['Alterado em'] = pd.to_datetime(df_base_original['Alterado em'], errors='coerce')
-
-    # ---> ADICIONE ESTA LINHA AQUI <---
-    # Ordena da modificação mais recente para a mais antiga.
-    # na_position='last' garante que linhas sem data de alteração fiquem no fim da tabela.
-    df_base_original = df_base_original.sort_values(by='Alterado em', ascending=False, na_position='last')
-
-    # 2. Pega a data mais recente (agora sim, de forma 100% segura)
-    atualizacao_recente = df_base_original['Alterado em'].max()
-
-    # 3. Formata para o subtítulo ficar bonito
-    # Verifica se a data existe (pd.notna) para evitar erro caso a coluna esteja vazia
-    if pd.notna(atualizacao_recente):
-        data_formatada = atualizacao_recente.strftime('%d/%m/%Y %H:%M:%S')
-    else:
-        data_formatada = "Data desconhecida"
-
-    st.subheader(f"Visualização da Base de Dados - Atualizado em: {data_formatada}")
-else:
+# --- TRAVA DE SEGURANÇA ---
+# Se o banco estiver vazio, interrompemos a construção da página para não dar erro
+if df_banco.empty:
     st.subheader(f"Visualização da Base de Dados")
+    st.info("O banco de dados está vazio. Use a barra lateral para fazer o primeiro upload.")
+    # O st.stop() faz o Streamlit parar de ler o código daqui pra baixo
+    # Isso evita que ele tente ler colunas que não existem.
+    st.stop()
 
-if not df_base_original.empty:
-
-    # --- SEUS FILTROS DE DATA AQUI ---
-    df_visualizacao = df_base_original.copy()
-
-    # --- NOVIDADE: TABELA DE "HOJE" ---
-    # Pegamos a data atual do sistema
-    hoje = datetime.now().date()
 
-    # Filtramos: Mostra se a data de corte OU a data de lançamento for HOJE
-    # Usamos .dt.date para garantir que estamos comparando apenas dia/mês/ano (ignorando horas)
-    print(f'df_visualizacao:\n{df_visualizacao.columns}')
+# --- FRAGMENTOS ---
+# Os blocos com @st.fragment reexecutam sozinhos: uma interação dentro deles
+# (filtro, edição, etc.) ou o timer não passa pelo resto da página.
 
-    df_visualizacao['Data de Lançamento'] = pd.to_datetime(
-        df_visualizacao['Data de Lançamento'], errors='coerce', dayfirst=True
-    )
-    df_visualizacao['Data de Corte'] = pd.to_datetime(
-        df_visualizacao['Data de Corte'], errors='coerce', dayfirst=True
-    )
+@st.fragment(run_every=INTERVALO_ALERTAS)
+def painel_alertas():
+    """Popover de alertas. Se atualiza sozinho a cada INTERVALO_ALERTAS"""
+    # Lê direto do snapshot (e não por argumento) para enxergar os dados novos a cada ciclo
+    df_visualizacao, _ = obter_base()
+    if df_visualizacao.empty:
+        st.caption("🔔 Sem alertas")
+        return
 
     df_alertas_corte = df_visualizacao.loc[
         df_visualizacao['Data de Lançamento'].notna()
         & df_visualizacao['Data de Corte'].notna()
         & (df_visualizacao['Data de Lançamento'] > df_visualizacao['Data de Corte'])
-        ].copy()
+        ]
 
     # ALERTA 2: lançamento no fim de semana
     df_alertas_fds = df_visualizacao.loc[
         df_visualizacao['Data de Lançamento'].notna()
         & (df_visualizacao['Data de Lançamento'].dt.dayofweek >= 5)
-        ].copy()
+        ]
 
     # ALERTA 3: lançamento muito distante da data atual
     # Defina aqui o limite de dias aceitável (ex: 90 dias para o passado ou futuro)
@@ -562,70 +918,84 @@ if not df_base_original.empty:
 
     total_alertas = len(df_alertas_corte) + len(df_alertas_fds) + len(df_alertas_distancia_lancamento) + len(df_alertas_distancia_corte)
 
-    col_esq, col_dir = st.columns([8, 2])
-
-    with col_dir:
-        if total_alertas > 0:
+    if total_alertas > 0:
+        # O toast só aparece quando a quantidade muda, e não a cada ciclo do timer
+        if st.session_state.get('alertas_notificados') != total_alertas:
+            st.session_state['alertas_notificados'] = total_alertas
             st.toast(
                 f"Há {total_alertas} alerta(s) de data para verificar.",
                 icon="🔔"
             )
 
-            with st.popover(f"🔔 Alertas ({total_alertas})", use_container_width=True):
-                if not df_alertas_corte.empty:
-                    st.warning("Convênios com Data de Lançamento após a Data de Corte")
-                    for _, row in df_alertas_corte.iterrows():
-                        st.write(
-                            f"**{row['Convênio']}**: "
-                            f"{row['Data de Lançamento'].strftime('%d/%m/%Y')} > "
-                            f"{row['Data de Corte'].strftime('%d/%m/%Y')}"
-                        )
-
-                if not df_alertas_fds.empty:
-                    st.warning("⚠️ Convênios com Data de Lançamento em fim de semana")
-
-                    # Dicionário de tradução (muito mais rápido que vários ifs)
-                    dias_traduzidos = {
-                        "Monday": "Segunda-feira", "Tuesday": "Terça-feira",
-                        "Wednesday": "Quarta-feira", "Thursday": "Quinta-feira",
-                        "Friday": "Sexta-feira", "Saturday": "Sábado", "Sunday": "Domingo"
-                    }
-
-                    # Criamos uma lista de strings para mostrar tudo de uma vez
-                    linhas_alerta = []
-                    for _, row in df_alertas_fds.iterrows():
-                        nome_ingles = row['Data de Lançamento'].day_name()
-                        dia_pt = dias_traduzidos.get(nome_ingles, nome_ingles)
-                        data_fmt = row['Data de Lançamento'].strftime('%d/%m/%Y')
-
-                        linhas_alerta.append(f"* **{row['Convênio']}**: {data_fmt} ({dia_pt})")
-
-                    # Mostra tudo em um bloco só (melhor performance)
-                    st.markdown("\n".join(linhas_alerta))
-
-                if not df_alertas_distancia_lancamento.empty:
-                    st.warning("⚠️ Convênios com Data de Lançamento com mais de 30 dias de distância")
-                    # Criamos uma lista de strings para mostrar tudo de uma vez
-                    linhas_alerta_distancia = []
-                    for _, row in df_alertas_distancia_lancamento.iterrows():
-                        linhas_alerta_distancia.append(f"* **{row['Convênio']}**: {row['Data de Lançamento'].strftime('%d/%m/%Y')}")
-
-                    # Mostra tudo em um bloco só (melhor performance)
-                    st.markdown("\n".join(linhas_alerta_distancia))
-
-                if not df_alertas_distancia_corte.empty:
-                    st.warning("⚠️ Convênios com Data de Corte com mais de 30 dias de distância")
-                    # Criamos uma lista de strings para mostrar tudo de uma vez
-                    linhas_alerta_distancia_corte = []
-                    for _, row in df_alertas_distancia_corte.iterrows():
-                        linhas_alerta_distancia_corte.append(f"* **{row['Convênio']}**: {row['Data de Corte'].strftime('%d/%m/%Y')}")
-
-                    # Mostra tudo em um bloco só (melhor performance)
-                    st.markdown("\n".join(linhas_alerta_distancia_corte))
+        with st.popover(f"🔔 Alertas ({total_alertas})", use_container_width=True):
+            if not df_alertas_corte.empty:
+                st.warning("Convênios com Data de Lançamento após a Data de Corte")
+                for _, row in df_alertas_corte.iterrows():
+                    st.write(
+                        f"**{row['Convênio']}**: "
+                        f"{row['Data de Lançamento'].strftime('%d/%m/%Y')} > "
+                        f"{row['Data de Corte'].strftime('%d/%m/%Y')}"
+                    )
+
+            if not df_alertas_fds.empty:
+                st.warning("⚠️ Convênios com Data de Lançamento em fim de semana")
+
+                # Dicionário de tradução (muito mais rápido que vários ifs)
+                dias_traduzidos = {
+                    "Monday": "Segunda-feira", "Tuesday": "Terça-feira",
+                    "Wednesday": "Quarta-feira", "Thursday": "Quinta-feira",
+                    "Friday": "Sexta-feira", "Saturday": "Sábado", "Sunday": "Domingo"
+                }
+
+                # Criamos uma lista de strings para mostrar tudo de uma vez
+                linhas_alerta = []
+                for _, row in df_alertas_fds.iterrows():
+                    nome_ingles = row['Data de Lançamento'].day_name()
+                    dia_pt = dias_traduzidos.get(nome_ingles, nome_ingles)
+                    data_fmt = row['Data de Lançamento'].strftime('%d/%m/%Y')
+
+                    linhas_alerta.append(f"* **{row['Convênio']}**: {data_fmt} ({dia_pt})")
+
+                # Mostra tudo em um bloco só (melhor performance)
+                st.markdown("\n".join(linhas_alerta))
+
+            if not df_alertas_distancia_lancamento.empty:
+                st.warning("⚠️ Convênios com Data de Lançamento com mais de 30 dias de distância")
+                # Criamos uma lista de strings para mostrar tudo de uma vez
+                linhas_alerta_distancia = []
+                for _, row in df_alertas_distancia_lancamento.iterrows():
+                    linhas_alerta_distancia.append(f"* **{row['Convênio']}**: {row['Data de Lançamento'].strftime('%d/%m/%Y')}")
+
+                # Mostra tudo em um bloco só (melhor performance)
+                st.markdown("\n".join(linhas_alerta_distancia))
+
+            if not df_alertas_distancia_corte.empty:
+                st.warning("⚠️ Convênios com Data de Corte com mais de 30 dias de distância")
+                # Criamos uma lista de strings para mostrar tudo de uma vez
+                linhas_alerta_distancia_corte = []
+                for _, row in df_alertas_distancia_corte.iterrows():
+                    linhas_alerta_distancia_corte.append(f"* **{row['Convênio']}**: {row['Data de Corte'].strftime('%d/%m/%Y')}")
+
+                # Mostra tudo em um bloco só (melhor performance)
+                st.markdown("\n".join(linhas_alerta_distancia_corte))
+
+    else:
+        st.session_state['alertas_notificados'] = 0
+        st.caption("🔔 Sem alertas")
 
-        else:
-            st.caption("🔔 Sem alertas")
 
+def painel_hoje(df_visualizacao):
+    """
+    Abas com as pendências de hoje (lançamentos, cortes e período de lançamento).
+    Não tem widgets, então não precisa ser fragmento: os reruns dos fragmentos
+    vizinhos já não passam por aqui.
+    """
+    # --- NOVIDADE: TABELA DE "HOJE" ---
+    # Pegamos a data atual do sistema
+    hoje = datetime.now().date()
+
+    # Filtramos: Mostra se a data de corte OU a data de lançamento for HOJE
+    # Usamos .dt.date para garantir que estamos comparando apenas dia/mês/ano (ignorando horas)
     filtro_lancamento_hoje = (
             df_visualizacao['Data de Lançamento'].dt.date == hoje
     )
@@ -675,10 +1045,7 @@ if not df_base_original.empty:
                 df_hoje_resumo,
                 use_container_width=True,
                 hide_index=True,
-                column_config={
-                    "Data de Corte": st.column_config.DateColumn("Data de Corte", format="DD/MM/YYYY"),
-                    "Data de Lançamento": st.column_config.DateColumn("Data de Lançamento", format="DD/MM/YYYY"),
-                }
+                column_config=COLUNAS_RESUMO_CONFIG
             )
         else:
             st.info(f"✅ Nenhuma pendência de lançamento para hoje ({hoje.strftime('%d/%m/%Y')}).")
@@ -691,10 +1058,7 @@ if not df_base_original.empty:
                 df_corte_resumo,
                 use_container_width=True,
                 hide_index=True,
-                column_config={
-                    "Data de Corte": st.column_config.DateColumn("Data de Corte", format="DD/MM/YYYY"),
-                    "Data de Lançamento": st.column_config.DateColumn("Data de Lançamento", format="DD/MM/YYYY"),
-                }
+                column_config=COLUNAS_RESUMO_CONFIG
             )
         else:
             st.info(f"✅ Nenhuma pendência de corte para hoje ({hoje.strftime('%d/%m/%Y')}).")
@@ -708,55 +1072,121 @@ if not df_base_original.empty:
                 df_lancando_resumo,
                 use_container_width=True,
                 hide_index=True,
-                column_config={
-                    "Data de Corte": st.column_config.DateColumn("Data de Corte", format="DD/MM/YYYY"),
-                    "Data de Lançamento": st.column_config.DateColumn("Data de Lançamento", format="DD/MM/YYYY"),
-                }
+                column_config=COLUNAS_RESUMO_CONFIG
             )
 
 
-    st.divider()  # Uma linha para separar o resumo da tabela completa
+@st.fragment
+def painel_base_geral(df_base_original):
+    """Filtros + tabela editável + download. Filtrar ou editar reexecuta só este bloco"""
+    # --- TABELA COMPLETA E FILTROS (CÓDIGO ANTERIOR) ---
+    st.subheader("Base Geral Completa")
 
+    # Linhas que não foram salvas no último "Salvar" porque outra pessoa alterou antes
+    conflitos = st.session_state.pop('conflitos_edicao', None)
+    if conflitos:
+        st.warning(
+            "⚠️ Algumas linhas foram alteradas por outra pessoa enquanto você editava e **não foram salvas**. "
+            "A tabela abaixo já mostra a versão atual; refaça a edição se ainda for necessário:\n\n"
+            + "\n".join(f"* {c}" for c in conflitos)
+        )
 
+    # --- AQUI ENTRAM OS SEUS FILTROS ---
+    # Os filtros ficam dentro do fragmento (e não na sidebar): widgets da sidebar
+    # sempre reexecutam a página inteira.
+    # As opções saem sem as células vazias: as colunas de texto são string[pyarrow] e o
+    # vazio vira pd.NA, que quebra a comparação do st.multiselect ("boolean value of NA
+    # is ambiguous") ao escolher uma opção listada depois dele.
+    with st.expander("🔍 Filtros de Visualização", expanded=True):
+        col_f1, col_f2, col_f3 = st.columns(3)
+
+        with col_f1:
+            convenios_filtro = st.multiselect(
+                "Filtrar Convênios:",
+                options=df_base_original['Convênio'].dropna().unique(),
+                key='f_convenio'
+            )
 
-    # --- TABELA COMPLETA E FILTROS (CÓDIGO ANTERIOR) ---
-    st.subheader("Base Geral Completa")
+            sistema_filtro = st.multiselect(
+                "Filtra Sistemas:",
+                options=df_base_original['Sistema'].dropna().unique(),
+                key='f_sistema'
+            )
+
+        with col_f2:
+            responsavel_filtro = st.multiselect(
+                "Responsável:",
+                options=df_base_original['Responsavel'].dropna().unique(),
+                key='f_resp'
+            )
+
+            validacao_filtro = st.multiselect(
+                "Validador:",
+                options=df_base_original['Validação'].dropna().unique(),
+                key='f_validacao'
+            )
+
+        with col_f3:
+            # 2. Seus filtros de Data
+            data_filtro_lancamento = st.date_input(
+                "Data de Lançamento exata:",
+                value=None,
+                format="DD/MM/YYYY",
+                key='f_data_lanc'
+            )
+
+            data_filtro_corte = st.date_input(
+                "Data de Corte exata:",
+                value=None,
+                format="DD/MM/YYYY",
+                key='f_data_corte'
+            )
+
+        # O botão chama a função ANTES de rodar o fragmento de novo
+        st.button("Limpar Filtros", on_click=limpar_tudo)
 
     # 2. Aplica a Lógica dos Filtros
+    # Montamos UMA máscara e recortamos o snapshot uma vez só no final
+    # (em vez de gerar um DataFrame novo a cada filtro)
+    selecao = pd.Series(True, index=df_base_original.index)
 
     # Filtro de convênios
     if convenios_filtro:
-        df_visualizacao = df_visualizacao[df_visualizacao['Convênio'].isin(convenios_filtro)]
+        selecao &= df_base_original['Convênio'].isin(convenios_filtro)
 
     # Filtro de sistemas
     if sistema_filtro:
-        df_visualizacao = df_visualizacao[df_visualizacao['Sistema'].isin(sistema_filtro)]
+        selecao &= df_base_original['Sistema'].isin(sistema_filtro)
 
     # Filtro dos responsáveis
     if responsavel_filtro:
-        df_visualizacao = df_visualizacao[df_visualizacao['Responsavel'].isin(responsavel_filtro)]
+        selecao &= df_base_original['Responsavel'].isin(responsavel_filtro)
 
     # Filtro dos validadores
     if validacao_filtro:
-        df_visualizacao = df_visualizacao[df_visualizacao['Validação'].isin(validacao_filtro)]
+        selecao &= df_base_original['Validação'].isin(validacao_filtro)
 
     # Filtro de Data de Lançamento
     if data_filtro_lancamento:
         # Precisamos usar .dt.date para comparar Data (input) com Timestamp (pandas)
-        df_visualizacao = df_visualizacao[df_visualizacao['Data de Lançamento'].dt.date == data_filtro_lancamento]
+        selecao &= df_base_original['Data de Lançamento'].dt.date == data_filtro_lancamento
 
     # Filtro de Data de Corte
     if data_filtro_corte:
-        df_visualizacao = df_visualizacao[df_visualizacao['Data de Corte'].dt.date == data_filtro_corte]
+        selecao &= df_base_original['Data de Corte'].dt.date == data_filtro_corte
 
-    # No seu código principal:
-    df_antes_de_editar = df_visualizacao.copy()  # Salva o estado do filtro
+    # Sem filtro nenhum, a tela usa o próprio snapshot; com filtro, só as linhas
+    # selecionadas são copiadas. (O st.data_editor ainda faz a cópia dele a cada rerun:
+    # é ela que volta em df_editado.)
+    # df_visualizacao é somente leitura: ele também serve de "antes da edição" no salvar.
+    df_visualizacao = df_base_original if selecao.all() else df_base_original.loc[selecao].reset_index(drop=True)
 
     df_editado = st.data_editor(
         df_visualizacao,
         hide_index=True,
         column_config={
             "id": None,
+            "versao": None,
             "Data de Corte": st.column_config.DateColumn("Data de Corte", format="DD/MM/YYYY"),
             "Data de Lançamento": st.column_config.DateColumn("Data de Lançamento", format="DD/MM/YYYY"),
             "Alterado em": st.column_config.DatetimeColumn("Alterado em",format="DD/MM/YYYY HH:mm:ss")
@@ -768,22 +1198,24 @@ if not df_base_original.empty:
     # 1. Criar um buffer na memória
     buffer = io.BytesIO()
 
-    df_sem_id = df_visualizacao.copy()
-    df_sem_id['Data de Corte'] = df_sem_id['Data de Corte'].dt.strftime('%d/%m/%Y')
-    df_sem_id['Data de Lançamento'] = df_sem_id['Data de Lançamento'].dt.strftime('%d/%m/%Y')
-    if 'id' in df_sem_id.columns:
-        df_sem_id = df_sem_id.drop(columns=['id'])
-    if 'Alterado em' in df_sem_id.columns:
-        df_sem_id = df_sem_id.drop(columns=['Alterado em'])
+    # drop/assign geram um DataFrame novo sem alterar o snapshot
+    df_sem_id = df_visualizacao.drop(
+        columns=[c for c in ['id', 'Alterado em', 'versao'] if c in df_visualizacao.columns]
+    ).assign(**{
+        'Data de Corte': df_visualizacao['Data de Corte'].dt.strftime('%d/%m/%Y'),
+        'Data de Lançamento': df_visualizacao['Data de Lançamento'].dt.strftime('%d/%m/%Y'),
+    })
     with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
         df_sem_id.to_excel(writer, index=False, sheet_name='Acessos')
+    dados_download = buffer.getvalue()
+    del df_sem_id, buffer
 
     st.caption(f"Mostrando {len(df_visualizacao)} registros encontrados.")
 
     # Botão de Download
     st.download_button(
         label="📥 Baixar Dados Filtrados",
-        data=buffer.getvalue(),
+        data=dados_download,
         file_name="relatorio_filtrado.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
@@ -792,7 +1224,54 @@ if not df_base_original.empty:
     if st.button("💾 Salvar Alterações", type="primary"):
         # Chamamos a função passando o que está na tela (editado)
         # e o que veio do banco (original) para comparação
-        salvar_edicoes_cirurgicas(df_editado, df_base_original, df_antes_de_editar)
+        # (ela termina com st.rerun(), que recarrega a página inteira)
+        salvar_edicoes_cirurgicas(df_editado, df_base_original, df_visualizacao)
+
+    # Memória: objetos desta sessão x snapshot atual (um por servidor)
+    memoria_sessao = medir_memoria_sessao(
+        df_visualizacao, df_editado, dados_download, ignorar=df_base_original
+    )
+    memoria_snapshot = tamanho_em_bytes(df_base_original)
+    ultima_carga = estado_leitura()['ultima_carga']
+    texto_carga = (
+        f" · última carga do banco (só DataFrames): pico ~{ultima_carga['pico_mb']:.2f} MB, final {ultima_carga['final_mb']:.2f} MB"
+        if ultima_carga else ""
+    )
+    st.caption(
+        f"💾 Memória desta sessão: {memoria_sessao / 1024 ** 2:.2f} MB · "
+        f"snapshot compartilhado atual: {memoria_snapshot / 1024 ** 2:.2f} MB{texto_carga}"
+    )
+
 
+# --- ÁREA PRINCIPAL ---
+# 1. Carrega do Banco (snapshot compartilhado, somente leitura)
+df_base_original = df_banco
+
+# 2. Pega a data mais recente
+atualizacao_recente = df_base_original['Alterado em'].max()
+
+# 3. Formata para o subtítulo ficar bonito
+# Verifica se a data existe (pd.notna) para evitar erro caso a coluna esteja vazia
+if pd.notna(atualizacao_recente):
+    data_formatada = atualizacao_recente.strftime('%d/%m/%Y %H:%M:%S')
 else:
-    st.info("O banco de dados está vazio. Use a barra lateral para fazer o primeiro upload.")
\ No newline at end of file
+    data_formatada = "Data desconhecida"
+
+col_esq, col_dir = st.columns([8, 2])
+
+with col_esq:
+    st.subheader(f"Visualização da Base de Dados - Atualizado em: {data_formatada}")
+    if desatualizado_desde is not None:
+        st.warning(
+            f"⚠️ Banco de dados indisponível no momento. Mostrando os dados carregados em "
+            f"{desatualizado_desde.strftime('%d/%m/%Y %H:%M:%S')} (desatualizados desde então)."
+        )
+
+with col_dir:
+    painel_alertas()
+
+painel_hoje(df_base_original)
+
+st.divider()  # Uma linha para separar o resumo da tabela completa
+
+painel_base_geral(df_base_original)
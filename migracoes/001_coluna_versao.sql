@@ -0,0 +1,3 @@
+-- Controle de concorrência otimista das edições (salvar_edicoes_cirurgicas).
+-- Rodar uma vez, com um usuário que tenha permissão de ALTER.
+ALTER TABLE tabela_corte ADD COLUMN versao INT NOT NULL DEFAULT 0;
@@ -0,0 +1,553 @@
+"""
+Teste de carga: simula N operadores usando o main.py ao mesmo tempo.
+
+Sobe UM servidor de verdade (`streamlit run main.py`, headless) e conecta N clientes
+pelo websocket do Streamlit, falando o mesmo protocolo do navegador (BackMsg/ForwardMsg).
+Assim todas as sessões dividem o mesmo runtime: o mesmo cache, o mesmo snapshot, o mesmo
+pool de conexões e as mesmas threads de script, como em produção. As sessões executam o
+roteiro filtrar -> editar -> salvar -> limpar filtros (e, opcionalmente, subir planilha)
+contra um banco local e no fim o script mostra, por etapa:
+
+- latência do rerun (p50/p95/p99), do envio da interação até o fim da execução
+- consultas ao banco por interação
+- memória por sessão (a mesma medida do rodapé da Base Geral)
+
+Uso:
+    python teste_carga.py --sessoes 20 --interacoes 5
+    python teste_carga.py --db-url mysql+mysqlconnector://root@127.0.0.1:4000/teste --upload
+    python teste_carga.py --sessoes 30 --limite-p95 1.5   # sai com erro se alguma etapa passar de 1,5s
+
+Observações:
+- Precisa do pacote `websockets` (pip install -r requirements-dev.txt).
+- Sem --db-url, cria um SQLite temporário com --linhas convênios. Com --db-url, use
+  um banco de TESTE: o roteiro grava de verdade (Responsavel = "CARGA ...").
+- As interações dentro da Base Geral são enviadas como rerun do fragmento, igual ao
+  navegador. O painel de alertas (run_every) não é disparado pelos clientes.
+- O upload faz o mesmo que o navegador (pede a URL pelo websocket, PUT multipart em
+  /_stcore/upload_file/..., clique em "Processar e Salvar"). O upsert usa
+  "ON DUPLICATE KEY UPDATE" (MySQL/TiDB), por isso só roda com --db-url MySQL.
+- "salvar" e "processar planilha" incluem o sleep(2) da mensagem de sucesso do
+  main.py, por isso ficam fora do --limite-p95.
+- As consultas são contadas no processo do servidor (evento do SQLAlchemy) e atribuídas
+  à sessão e à janela de tempo de cada interação.
+"""
+import argparse
+import asyncio
+import http.cookiejar
+import io
+import json
+import math
+import os
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from datetime import date, timedelta
+
+import pandas as pd
+
+# Etapas cuja latência inclui o sleep(2) da mensagem de sucesso do main.py
+ETAPAS_COM_SLEEP = {"salvar", "processar planilha"}
+
+PASTA = os.path.dirname(os.path.abspath(__file__))
+ARQUIVO_APP = os.path.join(PASTA, "main.py")
+
+
+def criar_banco_sqlite(caminho, linhas):
+    """Cria a tabela_corte num SQLite com `linhas` convênios fictícios"""
+    con = sqlite3.connect(caminho)
+    con.execute("DROP TABLE IF EXISTS tabela_corte")
+    con.execute("""
+        CREATE TABLE tabela_corte (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            Convênio TEXT UNIQUE, Sistema TEXT, Responsavel TEXT, Validação TEXT,
+            Referência TEXT, `Data de Corte` TEXT, `Data de Lançamento` TEXT,
+            `Alterado em` TEXT, versao INT NOT NULL DEFAULT 0
+        )
+    """)
+    hoje = date.today()
+    registros = []
+    for i in range(linhas):
+        corte = hoje + timedelta(days=random.randint(-40, 40))
+        # Parte das linhas com Sistema/Responsavel/Validação vazios, como vêm das planilhas
+        registros.append((
+            f"CONVÊNIO {i:05d}",
+            None if i % 10 == 3 else f"SISTEMA {i % 7}",
+            None if i % 15 == 4 else f"RESPONSÁVEL {i % 12}",
+            None if i % 20 == 5 else f"VALIDADOR {i % 4}",
+            None, corte.isoformat(), (corte - timedelta(days=random.randint(0, 5))).isoformat(),
+            f"{hoje.isoformat()} 08:00:00",
+        ))
+    con.executemany("""
+        INSERT INTO tabela_corte (
+            Convênio, Sistema, Responsavel, Validação, Referência,
+            `Data de Corte`, `Data de Lançamento`, `Alterado em`
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, registros)
+    con.commit()
+    con.close()
+
+
+def gerar_planilha(linhas):
+    """Planilha .xlsx no formato que o tratar_planilha espera"""
+    hoje = date.today()
+    df = pd.DataFrame({
+        'Convênio': [f"CONVÊNIO {i:05d}" for i in range(linhas)],
+        'Sistema': [f"SISTEMA {i % 7}" for i in range(linhas)],
+        'Responsavel': [f"RESPONSÁVEL {i % 12}" for i in range(linhas)],
+        'Validação': [f"VALIDADOR {i % 4}" for i in range(linhas)],
+        'Data corte': [(hoje + timedelta(days=i % 30)).strftime('%d/%m/%Y') for i in range(linhas)],
+        'Data lançamento': [(hoje + timedelta(days=i % 25)).strftime('%d/%m/%Y') for i in range(linhas)],
+    })
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def percentil(valores, p):
+    """Percentil pelo método nearest-rank"""
+    if not valores:
+        return float('nan')
+    ordenados = sorted(valores)
+    pos = max(0, math.ceil(p / 100 * len(ordenados)) - 1)
+    return ordenados[pos]
+
+
+# --- SERVIDOR (roda num processo separado) ---
+
+def servir():
+    """
+    Ponto de entrada do processo do servidor: `streamlit run main.py` com um contador
+    de consultas. Cada consulta vira uma linha "session_id<TAB>monotonic" no arquivo
+    de log, para o relatório atribuir à interação certa.
+    Argumentos: porta, arquivo de log.
+    """
+    porta, arquivo_log = sys.argv[1], sys.argv[2]
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    from streamlit.web import cli
+
+    log = open(arquivo_log, "a", buffering=1)
+    lock = threading.Lock()
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def contar(*_):
+        ctx = get_script_run_ctx()
+        with lock:
+            log.write(f"{ctx.session_id if ctx else '-'}\t{time.monotonic()}\n")
+
+    sys.argv = [
+        "streamlit", "run", ARQUIVO_APP,
+        "--server.port", porta,
+        "--server.address", "127.0.0.1",
+        "--server.headless", "true",
+        "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false",
+    ]
+    cli.main()
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def subir_servidor(pasta, db_url, arquivo_log):
+    """
+    Sobe o servidor com cwd numa pasta temporária, onde ficam o config.toml do projeto
+    e um secrets.toml apontando para o banco de teste. Devolve (processo, porta).
+    """
+    os.makedirs(os.path.join(pasta, ".streamlit"), exist_ok=True)
+    config = os.path.join(PASTA, ".streamlit", "config.toml")
+    if os.path.exists(config):
+        shutil.copy(config, os.path.join(pasta, ".streamlit", "config.toml"))
+    with open(os.path.join(pasta, ".streamlit", "secrets.toml"), "w") as f:
+        f.write(f"[mysql]\nurl = {json.dumps(db_url)}\n")
+
+    porta = porta_livre()
+    saida = open(os.path.join(pasta, "servidor.log"), "w")
+    processo = subprocess.Popen(
+        [sys.executable, "-c", "import teste_carga; teste_carga.servir()", str(porta), arquivo_log],
+        cwd=pasta, stdout=saida, stderr=subprocess.STDOUT,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [PASTA, os.environ.get("PYTHONPATH")]))},
+    )
+
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            break
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{porta}/_stcore/health", timeout=1) as r:
+                if r.status == 200:
+                    return processo, porta
+        except OSError:
+            time.sleep(0.3)
+
+    processo.kill()
+    with open(os.path.join(pasta, "servidor.log")) as f:
+        raise RuntimeError(f"O servidor do Streamlit não subiu:\n{f.read()}")
+
+
+# --- CLIENTE (um "navegador" sem tela) ---
+
+class Cliente:
+    """
+    Fala o protocolo do navegador pelo websocket: manda BackMsg.rerun_script com o estado
+    dos widgets e acompanha os ForwardMsg até o script terminar.
+    """
+
+    def __init__(self, ws):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        self.ws = ws
+        self.session_id = None
+        self.elementos = {}  # delta_path -> (Element, fragment_id, rodada)
+        self.estados = {}  # widget id -> WidgetState que o navegador reenviaria
+        self.cache = {}  # hash -> ForwardMsg (o servidor pode mandar só a referência)
+        self.rodada = 0
+        self.status = ForwardMsg.ScriptFinishedStatus
+
+    async def rerun(self, fragment_id="", gatilho=None):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ClientState_pb2 import ClientState
+
+        self.rodada += 1
+        estado = ClientState(query_string="", page_script_hash="", fragment_id=fragment_id)
+        estado.widget_states.widgets.extend(self.estados.values())
+        if gatilho is not None:
+            estado.widget_states.widgets.append(gatilho)
+        await self.ws.send(BackMsg(rerun_script=estado).SerializeToString())
+
+        # st.rerun() gera um FINISHED_EARLY_FOR_RERUN seguido de uma execução completa
+        while True:
+            msg = await self._proxima("script_finished")
+            if msg.script_finished != self.status.FINISHED_EARLY_FOR_RERUN:
+                break
+        self._descartar_antigos(msg.script_finished, fragment_id)
+
+    async def enviar_arquivo(self, uploader, nome, conteudo, base_http, xsrf):
+        """
+        Anexa um arquivo no st.file_uploader como o navegador: pede a URL de upload
+        pelo websocket, faz o PUT multipart e guarda o estado do widget para o rerun.
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.Common_pb2 import FileURLsRequest, UploadedFileInfo
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        pedido = FileURLsRequest(request_id=f"upload-{self.rodada}", file_names=[nome], session_id=self.session_id)
+        await self.ws.send(BackMsg(file_urls_request=pedido).SerializeToString())
+        while True:
+            resposta = (await self._proxima("file_urls_response")).file_urls_response
+            if resposta.response_id == pedido.request_id:
+                break
+        if resposta.error_msg:
+            raise RuntimeError(f"Upload recusado: {resposta.error_msg}")
+        urls = resposta.file_urls[0]
+
+        url = urls.upload_url if urls.upload_url.startswith("http") else base_http + urls.upload_url
+        await asyncio.to_thread(enviar_multipart, url, nome, conteudo, xsrf)
+
+        estado = WidgetState(id=uploader.id)
+        estado.file_uploader_state_value.uploaded_file_info.append(
+            UploadedFileInfo(file_id=urls.file_id, name=nome, size=len(conteudo), file_urls=urls)
+        )
+        self.estados[uploader.id] = estado
+
+    async def _proxima(self, tipo_esperado):
+        """Processa os ForwardMsg que chegarem até vir um do tipo esperado (e o devolve)"""
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(await self.ws.recv())
+            if msg.HasField("ref_hash"):
+                # Mensagem repetida: o servidor manda só o hash e a posição nova
+                completa = ForwardMsg()
+                completa.CopyFrom(self.cache[msg.ref_hash])
+                completa.metadata.CopyFrom(msg.metadata)
+                msg = completa
+            tipo = msg.WhichOneof("type")
+            if msg.metadata.cacheable and msg.hash:
+                self.cache[msg.hash] = msg
+
+            if tipo == "new_session" and self.session_id is None:
+                self.session_id = msg.new_session.initialize.session_id
+            elif tipo == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                elemento = msg.delta.new_element
+                widget = self._proto(elemento)
+                # O servidor mudou o valor (ex.: session_state no "Limpar Filtros"): vale o dele
+                if widget is not None and getattr(widget, "set_value", False):
+                    self.estados.pop(widget.id, None)
+                self.elementos[tuple(msg.metadata.delta_path)] = (elemento, msg.delta.fragment_id, self.rodada)
+            if tipo == tipo_esperado:
+                return msg
+
+    def _descartar_antigos(self, status, fragment_id):
+        """Some com o que não foi redesenhado nesta execução, como o navegador faz"""
+        if status == self.status.FINISHED_FRAGMENT_RUN_SUCCESSFULLY:
+            self.elementos = {
+                caminho: item for caminho, item in self.elementos.items()
+                if item[2] == self.rodada or item[1] != fragment_id
+            }
+        else:
+            self.elementos = {c: item for c, item in self.elementos.items() if item[2] == self.rodada}
+        ids = {w.id for w in (self._proto(e) for e, _, _ in self.elementos.values()) if w is not None}
+        self.estados = {i: ws for i, ws in self.estados.items() if i in ids}
+
+    @staticmethod
+    def _proto(elemento):
+        """Proto do widget dentro do Element (None se não for widget)"""
+        tipo = elemento.WhichOneof("type")
+        proto = getattr(elemento, tipo) if tipo else None
+        if proto is None or "id" not in proto.DESCRIPTOR.fields_by_name or not proto.id:
+            return None
+        return proto
+
+    def _procurar(self, condicao):
+        for elemento, fragment_id, _ in self.elementos.values():
+            tipo = elemento.WhichOneof("type")
+            if condicao(tipo, getattr(elemento, tipo)):
+                return getattr(elemento, tipo), fragment_id
+        return None, ""
+
+    def widget(self, tipo, key):
+        return self._procurar(lambda t, p: t == tipo and p.id.endswith(f"-{key}"))
+
+    def botao(self, rotulo):
+        return self._procurar(lambda t, p: t == "button" and p.label == rotulo)
+
+    def editor(self):
+        # "dataframe" nas versões novas, "arrow_data_frame" nas antigas; editing_mode 0 = st.dataframe
+        return self._procurar(
+            lambda t, p: t in ("dataframe", "arrow_data_frame") and getattr(p, "editing_mode", 0)
+        )
+
+    def textos(self, tipo):
+        return [getattr(e, tipo) for e, _, rodada in self.elementos.values()
+                if e.WhichOneof("type") == tipo and rodada == self.rodada]
+
+
+def obter_xsrf(base_http):
+    """
+    Token XSRF que o navegador recebe em cookie (o health check já devolve o cookie).
+    None quando o servidor está com a proteção desligada.
+    """
+    cookies = http.cookiejar.CookieJar()
+    abridor = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+    abridor.open(f"{base_http}/_stcore/health", timeout=10).close()
+    return next((c.value for c in cookies if c.name == "_streamlit_xsrf"), None)
+
+
+def enviar_multipart(url, nome, conteudo, xsrf):
+    """PUT multipart/form-data, o mesmo que o st.file_uploader faz no navegador"""
+    fronteira = f"----carga{random.getrandbits(64):x}"
+    corpo = (
+        f"--{fronteira}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{nome}"\r\n'
+        "Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet\r\n\r\n"
+    ).encode() + conteudo + f"\r\n--{fronteira}--\r\n".encode()
+    cabecalhos = {"Content-Type": f"multipart/form-data; boundary={fronteira}"}
+    if xsrf:
+        cabecalhos["X-Xsrftoken"] = xsrf
+        cabecalhos["Cookie"] = f"_streamlit_xsrf={xsrf}"
+    pedido = urllib.request.Request(url, data=corpo, headers=cabecalhos, method="PUT")
+    urllib.request.urlopen(pedido, timeout=60).close()
+
+
+def estado_multiselect(proto, escolhidos):
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    ws = WidgetState(id=proto.id)
+    if "raw_values" in proto.DESCRIPTOR.fields_by_name:
+        # Versões novas mandam os próprios valores; as antigas, os índices das opções
+        ws.string_array_value.data[:] = escolhidos
+    else:
+        ws.int_array_value.data[:] = [list(proto.options).index(o) for o in escolhidos]
+    return ws
+
+
+def clique(proto):
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+    return WidgetState(id=proto.id, trigger_value=True)
+
+
+async def executar_sessao(num_sessao, base_http, interacoes, timeout, planilha):
+    import websockets
+    from streamlit.proto.Alert_pb2 import Alert
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    medicoes = []
+    conflitos = 0
+
+    xsrf = await asyncio.to_thread(obter_xsrf, base_http) if planilha else None
+    url = base_http.replace("http", "ws", 1) + "/_stcore/stream"
+    async with websockets.connect(url, subprotocols=["streamlit"], max_size=None) as ws:
+        cliente = Cliente(ws)
+
+        async def medir(etapa, fragment_id="", gatilho=None):
+            inicio = time.monotonic()
+            await asyncio.wait_for(cliente.rerun(fragment_id, gatilho), timeout)
+            fim = time.monotonic()
+            erros = cliente.textos("exception") + [
+                a for a in cliente.textos("alert") if a.format == Alert.ERROR
+            ]
+            medicoes.append({
+                "etapa": etapa, "latencia": fim - inicio, "inicio": inicio, "fim": fim,
+                "erro": bool(erros), "sessao": cliente.session_id,
+            })
+
+        await medir("abrir")
+        for i in range(interacoes):
+            # 1. Filtrar por alguns sistemas
+            filtro, fragmento = cliente.widget("multiselect", "f_sistema")
+            opcoes = list(filtro.options)
+            cliente.estados[filtro.id] = estado_multiselect(filtro, random.sample(opcoes, k=min(2, len(opcoes))))
+            await medir("filtrar", fragmento)
+
+            # 2. Editar uma linha da tela (o mesmo JSON que o navegador manda)
+            editor, fragmento = cliente.editor()
+            if editor is not None:
+                edicao = {
+                    "edited_rows": {str(random.randrange(3)): {"Responsavel": f"CARGA {num_sessao}-{i}"}},
+                    "added_rows": [],
+                    "deleted_rows": [],
+                }
+                cliente.estados[editor.id] = WidgetState(id=editor.id, string_value=json.dumps(edicao))
+                await medir("editar", fragmento)
+
+                # 3. Salvar (o estado da edição vai junto com o clique)
+                salvar, fragmento = cliente.botao("💾 Salvar Alterações")
+                await medir("salvar", fragmento, clique(salvar))
+                conflitos += sum(
+                    "não foram salvas" in a.body for a in cliente.textos("alert") if a.format == Alert.WARNING
+                )
+
+            # 4. Limpar filtros
+            limpar, fragmento = cliente.botao("Limpar Filtros")
+            await medir("limpar filtros", fragmento, clique(limpar))
+
+            # 5. Subir planilha (só MySQL/TiDB): anexar no sidebar e processar
+            if planilha:
+                uploader, _ = cliente._procurar(lambda t, p: t == "file_uploader")
+                await cliente.enviar_arquivo(uploader, f"carga_{num_sessao}_{i}.xlsx", planilha, base_http, xsrf)
+                await medir("anexar planilha")
+                processar, _ = cliente.botao("Processar e Salvar")
+                await medir("processar planilha", "", clique(processar))
+
+        memoria = None
+        for texto in cliente.textos("markdown"):
+            achou = re.search(r"Memória desta sessão: ([\d.]+) MB", texto.body)
+            if achou:
+                memoria = float(achou.group(1))
+
+    return {"medicoes": medicoes, "memoria_mb": memoria, "conflitos": conflitos}
+
+
+async def executar_sessoes(base_http, sessoes, interacoes, timeout, planilha):
+    return await asyncio.gather(*(
+        executar_sessao(n, base_http, interacoes, timeout, planilha) for n in range(sessoes)
+    ))
+
+
+def contar_consultas(resultados, arquivo_log):
+    """Atribui cada consulta do log à interação (sessão + janela de tempo) em que ocorreu"""
+    por_sessao = defaultdict(list)
+    with open(arquivo_log) as f:
+        for linha in f:
+            sessao, instante = linha.rstrip("\n").split("\t")
+            por_sessao[sessao].append(float(instante))
+    for r in resultados:
+        for m in r["medicoes"]:
+            m["consultas"] = sum(m["inicio"] <= t <= m["fim"] for t in por_sessao[m["sessao"]])
+
+
+# --- RELATÓRIO ---
+
+def imprimir_relatorio(resultados, duracao):
+    medicoes = [m for r in resultados for m in r["medicoes"]]
+    etapas = list(dict.fromkeys(m["etapa"] for m in medicoes))
+
+    print(f"\n{len(resultados)} sessões, {len(medicoes)} interações em {duracao:.1f}s\n")
+    print(f"{'etapa':<20}{'n':>6}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}{'consultas/int':>15}{'erros':>7}")
+    for etapa in etapas + ["TOTAL"]:
+        grupo = [m for m in medicoes if etapa == "TOTAL" or m["etapa"] == etapa]
+        latencias = [m["latencia"] for m in grupo]
+        print(
+            f"{etapa:<20}{len(grupo):>6}"
+            f"{percentil(latencias, 50):>10.3f}{percentil(latencias, 95):>10.3f}{percentil(latencias, 99):>10.3f}"
+            f"{sum(m['consultas'] for m in grupo) / len(grupo):>15.2f}"
+            f"{sum(m['erro'] for m in grupo):>7}"
+        )
+
+    memorias = [r["memoria_mb"] for r in resultados if r["memoria_mb"] is not None]
+    if memorias:
+        print(f"\nMemória por sessão: média {sum(memorias) / len(memorias):.2f} MB, máx {max(memorias):.2f} MB")
+    print(f"Conflitos de edição (linhas não salvas): {sum(r['conflitos'] for r in resultados)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do main.py com N sessões simultâneas")
+    parser.add_argument("--sessoes", type=int, default=10, help="sessões simultâneas")
+    parser.add_argument("--interacoes", type=int, default=3, help="repetições do roteiro por sessão")
+    parser.add_argument("--linhas", type=int, default=500, help="convênios no SQLite gerado")
+    parser.add_argument("--db-url", help="URL SQLAlchemy de um banco já populado (padrão: SQLite temporário)")
+    parser.add_argument("--upload", action="store_true", help="inclui o envio de planilha (só MySQL/TiDB)")
+    parser.add_argument("--timeout", type=float, default=60, help="timeout de cada rerun (s)")
+    parser.add_argument(
+        "--limite-p95", type=float,
+        help="falha (exit 1) se o p95 de alguma etapa passar disso (s); "
+             "'salvar' e 'processar planilha' ficam de fora por causa do sleep(2)"
+    )
+    args = parser.parse_args()
+
+    pasta_temp = tempfile.TemporaryDirectory()
+    db_url = args.db_url
+    if not db_url:
+        caminho = os.path.join(pasta_temp.name, "carga.sqlite")
+        criar_banco_sqlite(caminho, args.linhas)
+        db_url = f"sqlite:///{caminho}"
+
+    if args.upload and not db_url.startswith("mysql"):
+        parser.error("--upload precisa de --db-url MySQL/TiDB (o upsert usa ON DUPLICATE KEY UPDATE)")
+    planilha = gerar_planilha(args.linhas) if args.upload else None
+
+    arquivo_log = os.path.join(pasta_temp.name, "consultas.log")
+    processo, porta = subir_servidor(pasta_temp.name, db_url, arquivo_log)
+    try:
+        inicio = time.perf_counter()
+        resultados = asyncio.run(executar_sessoes(
+            f"http://127.0.0.1:{porta}", args.sessoes, args.interacoes, args.timeout, planilha
+        ))
+        duracao = time.perf_counter() - inicio
+    finally:
+        processo.terminate()
+        processo.wait()
+
+    contar_consultas(resultados, arquivo_log)
+    imprimir_relatorio(resultados, duracao)
+    pasta_temp.cleanup()
+
+    if args.limite_p95 is not None:
+        medicoes = [m for r in resultados for m in r["medicoes"] if m["etapa"] not in ETAPAS_COM_SLEEP]
+        estouradas = []
+        for etapa in dict.fromkeys(m["etapa"] for m in medicoes):
+            p95 = percentil([m["latencia"] for m in medicoes if m["etapa"] == etapa], 95)
+            if p95 > args.limite_p95:
+                estouradas.append(f"{etapa} ({p95:.3f}s)")
+        if estouradas:
+            print(f"\n❌ p95 acima do limite de {args.limite_p95:.3f}s: {', '.join(estouradas)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()